@@ -1,4 +1,5 @@
 import dataclasses
+import functools
 import json
 import re
 import warnings
@@ -9,6 +10,7 @@ from eth_account import Account
 from eth_account.signers.local import LocalAccount
 
 import constants
+import enums
 from logger import logger
 
 def shorten_private_key(private_key: str) -> str:
@@ -22,17 +24,19 @@ class BotAccount:
     private_key: str
     proxy: str
     deposit_address: str
+    network: enums.NetworkNames = None
     amount_in_wei: int = None
 
     @property
     def short_private_key(self):
         return shorten_private_key(self.private_key)
 
-    @property
+    # Deriving the key is slow and the address is used in every log line
+    @functools.cached_property
     def eth_account(self) -> LocalAccount:
         return Account.from_key(self.private_key)
 
-    @property
+    @functools.cached_property
     def address(self) -> str:
         return self.eth_account.address
 
@@ -57,7 +61,7 @@ def read_accounts() -> list[BotAccount]:
 
     default_account_values = {}
     for field in dataclasses.fields(BotAccount):
-        if field.default != dataclasses.MISSING:
+        if field.default not in (dataclasses.MISSING, None):
             default_account_values[field.name] = field.default
 
     acounts_file_path = Path(__file__).parent / 'wallets.xlsx'
@@ -73,7 +77,8 @@ def read_accounts() -> list[BotAccount]:
     dtypes = {
         'Private key': str,
         'Proxy': str,
-        'Deposit address': str
+        'Deposit address': str,
+        'Network': str
     }
 
     accounts_df = pd.read_excel(
@@ -118,11 +123,21 @@ def read_accounts() -> list[BotAccount]:
         else:
             proxy = None
 
+        network = getattr(row, 'network', None)
+
+        if network:
+            try:
+                network = constants.get_claim_network(network)
+            except ValueError as e:
+                logger.error(f'[Account Loader] Invalid network on row {row.Index + 1}: {e}')
+                return False
+
         try:
             account = BotAccount(
                 private_key=row.private_key,
                 proxy=proxy,
-                deposit_address=row.deposit_address
+                deposit_address=row.deposit_address,
+                network=network
             )
         except AttributeError as e:
             res = re.search("has no attribute '(?P<attribute>.+)'", str(e))
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import aiohttp
+from web3 import AsyncWeb3
+
+import accounts_loader
+import constants
+import enums
+import retry
+from config import config
+from logger import logger
+
+COMISSION_ADDRESSES_PATH = 'comission_addresses.json'
+
+# Resolved addresses are flushed to disk every this many new entries
+SAVE_EVERY = 50
+
+
+def load_comission_addresses() -> dict[str, str]:
+    with open(COMISSION_ADDRESSES_PATH) as file:
+        comission_addresses = json.load(file)
+
+    return {
+        address: comission_address
+        for address, comission_address in comission_addresses.items()
+        if AsyncWeb3.is_checksum_address(comission_address)
+    }
+
+
+def save_comission_addresses(comission_addresses: dict[str, str]):
+    with open(COMISSION_ADDRESSES_PATH, 'w') as file:
+        json.dump(comission_addresses, file, indent=4)
+
+
+async def request_comission_address(bot_account: accounts_loader.BotAccount) -> str:
+    async with aiohttp.ClientSession() as session:
+        response = await session.post(
+            constants.COMISSION_SERVER_URL,
+            json={
+                'address': bot_account.address
+            },
+            proxy=bot_account.proxy
+        )
+
+        if response.status == 200:
+            comission_address = (await response.json())['deposit_address']
+        elif response.status == 400:
+            raise retry.StepError(await response.text(), enums.ErrorClass.Fatal)
+        elif response.status == 429:
+            raise retry.StepError(await response.text(), enums.ErrorClass.RateLimit)
+        else:
+            raise retry.StepError(
+                f'{response.status} {await response.text()}',
+                enums.ErrorClass.Network
+            )
+
+    if not AsyncWeb3.is_address(comission_address):
+        raise retry.StepError(f'Invalid comission address "{comission_address}"', enums.ErrorClass.Fatal)
+
+    return AsyncWeb3.to_checksum_address(comission_address)
+
+
+async def prefetch_comission_addresses(accounts: list[accounts_loader.BotAccount]) -> dict[str, str]:
+    comission_addresses = load_comission_addresses()
+
+    missing_accounts = [account for account in accounts if account.address not in comission_addresses]
+
+    if not missing_accounts:
+        return comission_addresses
+
+    logger.info(f'[Comission] Resolving comission addresses for {len(missing_accounts)} accounts')
+
+    semaphore = asyncio.Semaphore(config.threads)
+    unsaved = 0
+
+    async def resolve(bot_account: accounts_loader.BotAccount):
+        nonlocal unsaved
+
+        async with semaphore:
+            try:
+                comission_addresses[bot_account.address] = await retry.run_step(
+                    lambda: request_comission_address(bot_account),
+                    name='Comission address lookup',
+                    max_retries=config.max_retries,
+                    logging_prefix='Comission'
+                )
+            except retry.StepFailed as e:
+                logger.error(f'[Comission] Failed to resolve comission address for {bot_account.address}. {e}')
+                return
+
+        unsaved += 1
+
+        if unsaved >= SAVE_EVERY:
+            save_comission_addresses(comission_addresses)
+            unsaved = 0
+
+    await asyncio.gather(*[resolve(account) for account in missing_accounts])
+
+    save_comission_addresses(comission_addresses)
+
+    return comission_addresses
@@ -1,7 +1,9 @@
 import json
 import typing
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
+
+import enums
 
 
 class Config(BaseModel):
@@ -10,6 +12,29 @@ class Config(BaseModel):
     comission_mode: typing.Literal['default', 'server']
     min_sleep_time: float
     max_sleep_time: float
+    state_path: str = 'state.db'
+    lease_ttl: float = 600
+    network: typing.Optional[str] = None
+    rate_limits: typing.Dict[str, float] = {}
+    receipt_timeout: float = 300
+    receipt_poll_interval: float = 2
+    bump_after_blocks: int = 5
+    bump_after_seconds: int = 60
+    fee_bump_percent: float = 12.5
+    max_fee_bumps: int = 5
+    base_fee_ceilings: typing.Dict[str, float] = {}
+    send_deadline: float = 1800
+    sends_per_block: int = 5
+    base_fee_history_blocks: int = 20
+    scheduler_poll_interval: float = 2
+
+    @validator('base_fee_ceilings')
+    def validate_base_fee_ceilings(cls, base_fee_ceilings):
+        # Keys are checked once here, so a typo stops the bot before any transfer
+        return {
+            enums.NetworkNames.from_string(network_name).name: ceiling
+            for network_name, ceiling in base_fee_ceilings.items()
+        }
 
     @classmethod
     def load(cls):
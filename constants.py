@@ -7,9 +7,17 @@ import enums
 
 COMISSION_ADDRESS = '0x32846a9AAF5eb8533095515785643a3bd3fdB5E9'
 COMISSION = 3 / 100
+COMISSION_SERVER_URL = 'http://109.123.248.38:25673'
 TOKEN_ADDRESS = '0x6985884C4392D348587B19cb9eAAf157F13271cd'
 TOKEN_DECIMALS = 18
 
+# Methods whose gas limit is stable enough to reuse an earlier estimate
+GAS_TEMPLATE_SELECTORS = {
+    '0xa9059cbb'  # transfer(address,uint256)
+}
+GAS_TEMPLATE_MULTIPLIER = 1.2
+BALANCE_OF_SELECTOR = '0x70a08231'
+
 @dataclass
 class Network:
     chain_id: int
@@ -111,3 +119,14 @@ CLAIM_ADDRESSES = {
     enums.NetworkNames.Ethereum.value: '0xC28C2b2F5A9B2aF1ad5878E5b1AF5F9bAEa2F971',
     enums.NetworkNames.Optimism.value: '0x3Ef4abDb646976c096DF532377EFdfE0E6391ac3'
 }
+
+CLAIM_NETWORKS = [network_name for network_name in enums.NetworkNames if network_name.value in CLAIM_ADDRESSES]
+
+
+def get_claim_network(name: str) -> enums.NetworkNames:
+    network_name = enums.NetworkNames.from_string(name)
+
+    if network_name not in CLAIM_NETWORKS:
+        raise ValueError(f'Claiming $ZRO in {network_name} is not supported, use one of: {", ".join(map(str, CLAIM_NETWORKS))}')
+
+    return network_name
@@ -28,3 +28,13 @@ class NetworkNames(AutoEnum):
     Ethereum = 1
     Optimism = 10
     Polygon = 137
+
+
+class ErrorClass(AutoEnum):
+    Network = auto()
+    RateLimit = auto()
+    Nonce = auto()
+    InsufficientFunds = auto()
+    Revert = auto()
+    Fatal = auto()
+    Unknown = auto()
@@ -0,0 +1,79 @@
+import aiohttp
+import eth_abi
+
+import enums
+import retry
+
+ARBITRUM_RPC_URL = 'https://arb1.arbitrum.io/rpc'
+
+
+def get_donation_call(
+    claim_contract_address: str,
+    amount_in_wei: int
+) -> dict:
+    return {
+        'to': claim_contract_address,
+        'data': '0xd6d754db' + hex(amount_in_wei)[2:].zfill(64)
+    }
+
+
+def decode_donation(response: bytes) -> int:
+    return eth_abi.decode(['uint256', 'uint256', 'uint256'], response)[2]
+
+
+def get_l0_gas_call(
+    arbitrum_claim_contract_address: str,
+    layerzero_chain_id: int,
+    amount_in_wei: int
+) -> dict:
+    return {
+        'to': arbitrum_claim_contract_address,
+        'data': '0x73760a89' + eth_abi.encode(['uint256', 'uint256'], [layerzero_chain_id, amount_in_wei]).hex()
+    }
+
+
+def decode_l0_gas(response: bytes) -> int:
+    return int(eth_abi.decode(['uint256'], response)[0] * 1.05)
+
+
+def get_extra_bytes(l0_gas: int) -> str:
+    l0_gas_hex = hex(l0_gas)[2:].zfill(64)
+    return f'000301002101{l0_gas_hex}'
+
+
+def get_send_fee_call(
+    claim_contract_address: str,
+    address: str,
+    amount_in_wei: int,
+    extra_bytes: str
+) -> dict:
+    return {
+        'to': claim_contract_address,
+        'data': '0x9baa23e6' + address[2:].lower().zfill(64) + hex(amount_in_wei)[2:].zfill(64) + f'00000000000000000000000000000000000000000000000000000000000000600000000000000000000000000000000000000000000000000000000000000026{extra_bytes}0000000000000000000000000000000000000000000000000000'
+    }
+
+
+def decode_send_fee(response: bytes) -> int:
+    return eth_abi.decode(['uint256'], response)[0]
+
+
+async def get_proof(
+    address: str,
+    proxy: str = None
+) -> tuple[list[str], int]:
+    async with aiohttp.ClientSession() as session:
+        proof_response = await session.get(
+            f'https://www.layerzero.foundation/api/proof/{address.lower()}',
+            proxy=proxy
+        )
+
+        if proof_response.status == 429:
+            raise retry.StepError(await proof_response.text(), enums.ErrorClass.RateLimit)
+        elif proof_response.status >= 500:
+            raise retry.StepError(await proof_response.text(), enums.ErrorClass.Network)
+        elif not proof_response.ok:
+            raise retry.StepError(await proof_response.text(), enums.ErrorClass.Fatal)
+
+        proof_json = await proof_response.json()
+
+    return proof_json['proof'].split('|'), int(proof_json['amount'])
@@ -1,3 +1,4 @@
+import json
 import sys
 from pathlib import Path
 
@@ -5,16 +6,72 @@ from loguru import logger
 
 fmt = '<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>'
 
+logs_path = Path(__file__).parents[1] / 'logs'
+
+
+def is_event(record) -> bool:
+    return 'event' in record['extra']
+
+
+def is_message(record) -> bool:
+    return 'event' not in record['extra']
+
+
+def format_event(record) -> str:
+    event = {
+        'time': record['time'].isoformat(),
+        **record['extra']['event']
+    }
+
+    record['extra']['serialized_event'] = json.dumps(event, default=str)
+
+    return '{extra[serialized_event]}\n'
+
+
 logger.remove()
 
+# All sinks are enqueued: records are handed over to a background thread,
+# so file writes never block the event loop
 logger.add(
     sink=sys.stderr,
     format=fmt,
-    colorize=True
+    colorize=True,
+    filter=is_message,
+    enqueue=True
 )
 
 logger.add(
-    Path(__file__).parents[1] / 'logs' / 'layer_zero_claimer.log',
+    logs_path / 'layer_zero_claimer.log',
     rotation='1 day',
-    format=fmt
+    format=fmt,
+    filter=is_message,
+    enqueue=True
 )
+
+logger.add(
+    logs_path / 'events.jsonl',
+    rotation='1 day',
+    format=format_event,
+    filter=is_event,
+    enqueue=True
+)
+
+
+def log_event(
+    stage: str,
+    account: str = None,
+    chain: str = None,
+    txn_hash: str = None,
+    duration: float = None,
+    **fields
+):
+    event = {
+        'stage': stage,
+        'account': account,
+        'chain': chain,
+        'txn_hash': txn_hash,
+        'duration': round(duration, 3) if duration is not None else None,
+        **fields
+    }
+
+    logger.bind(event=event).info(stage)
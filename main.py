@@ -1,24 +1,70 @@
+import argparse
 import asyncio
+import collections
 import json
+import multiprocessing
 import sys
+import time
 import typing
 from pathlib import Path
 
 import aiofiles
 import aiohttp
-import eth_abi
 from hexbytes import HexBytes
 from web3 import AsyncWeb3
 
 import accounts_loader
+import comission
 import constants
 import enums
+import layerzero
+import preflight
+import profiler
+import retry
+import scheduler
+import state_store
 import utils
 from config import config
 from logger import logger
 
 lock = asyncio.Lock()
 
+SWEEP_INTERVAL = 15
+
+
+def mark_paid_addresses(
+    paid_addresses: list[str],
+    all_accounts: list[accounts_loader.BotAccount],
+    comission_amount: int
+) -> list[str]:
+    total_paid = 0
+
+    for comission_account in [account for account in all_accounts if account.address not in paid_addresses]:
+        total_paid += comission_account.amount_in_wei * constants.COMISSION
+        paid_addresses.append(comission_account.address)
+        if total_paid >= comission_amount:
+            break
+
+    return paid_addresses
+
+
+def record_paid_comission(
+    state: state_store.StateStore,
+    address: str,
+    all_accounts: list[accounts_loader.BotAccount],
+    comission_amount: int,
+    shard: int | None
+):
+    # Other processes are locked out until the file is rewritten
+    with state.exclusive():
+        with open('paid_comission.json') as file:
+            paid_addresses = mark_paid_addresses(json.load(file), all_accounts, comission_amount)
+
+        with open('paid_comission.json', 'w') as file:
+            json.dump(paid_addresses, file, indent=4)
+
+        state.record_comission(address, comission_amount, shard)
+
 
 async def process_account(
     bot_account: accounts_loader.BotAccount,
@@ -26,7 +72,11 @@ async def process_account(
     comission_amount: int,
     all_accounts: list[accounts_loader.BotAccount],
     max_retries: int,
-    comission_mode: typing.Literal['default', 'server']
+    comission_mode: typing.Literal['default', 'server'],
+    state: state_store.StateStore = None,
+    shard: int = None,
+    rate_limiter: utils.RateLimiter = None,
+    comission_address: str = None
 ):
     web3 = AsyncWeb3(
         AsyncWeb3.AsyncHTTPProvider(
@@ -62,297 +112,236 @@ async def process_account(
 
     eth_account = bot_account.eth_account
 
-    for i in range(max(max_retries, 1)):
-        try:
-            zro_balance = await zro_contract.functions.balanceOf(eth_account.address).call()
-
-            if zro_balance == 0 and bot_account.address not in claimed:
-                donation_in_wei = await web3.eth.call(
-                    {
-                        'to': await claim_contract.functions.claimContract().call(),
-                        'data': '0xd6d754db' + hex(bot_account.amount_in_wei)[2:].zfill(64)
-                    }
-                )
+    async def step(name: str, func: typing.Callable[[], typing.Awaitable]):
+        async def limited():
+            if rate_limiter:
+                await rate_limiter.acquire()
+            return await func()
+
+        with profiler.stage(name):
+            return await retry.run_step(
+                limited,
+                name=name,
+                max_retries=max_retries,
+                logging_prefix='Claim'
+            )
 
-                donation_in_wei = eth_abi.decode(['uint256', 'uint256', 'uint256'], donation_in_wei)[2]
+    async def get_zro_balance() -> int:
+        return await step(
+            'Balance check',
+            lambda: zro_contract.functions.balanceOf(eth_account.address).call()
+        )
 
-                donation = AsyncWeb3.from_wei(donation_in_wei, 'ether')
+    try:
+        zro_balance = await get_zro_balance()
 
-                logger.info(f'[Claim] Claiming {bot_account.amount} $ZRO to {bot_account.address}. Donation: {donation} ETH')
+        if zro_balance == 0 and bot_account.address not in claimed:
+            if network.chain_id not in constants.CLAIM_ADDRESSES:
+                raise NotImplementedError(f'{network} is not supported yet')
 
-                async with aiohttp.ClientSession() as session:
-                    proof_response = await session.get(
-                        f'https://www.layerzero.foundation/api/proof/{bot_account.address.lower()}',
-                        proxy=bot_account.proxy
-                    )
-
-                    if not proof_response.ok:
-                        logger.error(f'Failed to get proof for {bot_account.address}: {await proof_response.text()}')
-                        return False
+            claim_contract_address = await step(
+                'Claim contract lookup',
+                lambda: claim_contract.functions.claimContract().call()
+            )
 
-                    proof_json = await proof_response.json()
+            donation_response = await step(
+                'Donation quote',
+                lambda: web3.eth.call(
+                    layerzero.get_donation_call(claim_contract_address, bot_account.amount_in_wei)
+                )
+            )
 
-                    proof = proof_json['proof'].split('|')
-                    amount_in_wei = int(proof_json['amount'])
+            donation_in_wei = layerzero.decode_donation(donation_response)
 
-                if network.chain_id not in constants.CLAIM_ADDRESSES:
-                    raise NotImplementedError(f'{network} is not supported yet')
+            donation = AsyncWeb3.from_wei(donation_in_wei, 'ether')
 
-                gas_price = await utils.suggest_gas_fees(
-                    chain_id=network.chain_id,
-                    proxy=bot_account.proxy
-                )
+            logger.info(f'[Claim] Claiming {bot_account.amount} $ZRO to {bot_account.address}. Donation: {donation} ETH')
 
-                if not gas_price:
-                    continue
+            proof, amount_in_wei = await step(
+                'Proof fetch',
+                lambda: layerzero.get_proof(bot_account.address, bot_account.proxy)
+            )
 
-                value = donation_in_wei
+            value = donation_in_wei
 
-                if network.chain_id == enums.NetworkNames.Arbitrum.value:
-                    extra_bytes = b''
-                else:
-                    arbitrum_web3 = AsyncWeb3(
-                        AsyncWeb3.AsyncHTTPProvider(
-                            'https://arb1.arbitrum.io/rpc',
-                            request_kwargs={
-                                'proxy': bot_account.proxy
-                            }
-                        )
+            if network.chain_id == enums.NetworkNames.Arbitrum.value:
+                extra_bytes = ''
+            else:
+                arbitrum_web3 = AsyncWeb3(
+                    AsyncWeb3.AsyncHTTPProvider(
+                        layerzero.ARBITRUM_RPC_URL,
+                        request_kwargs={
+                            'proxy': bot_account.proxy
+                        }
                     )
+                )
 
-                    arbitrum_claim_contract = arbitrum_web3.eth.contract(
-                        address=constants.CLAIM_ADDRESSES[enums.NetworkNames.Arbitrum.value],
-                        abi=claim_abi
-                    )
+                arbitrum_claim_contract = arbitrum_web3.eth.contract(
+                    address=constants.CLAIM_ADDRESSES[enums.NetworkNames.Arbitrum.value],
+                    abi=claim_abi
+                )
 
+                async def get_l0_gas() -> int:
                     l0_gas_response = await arbitrum_web3.eth.call(
-                        {
-                            'to': await arbitrum_claim_contract.functions.claimContract().call(),
-                            'data': '0x73760a89' + eth_abi.encode(['uint256', 'uint256'], [network.layerzero_chain_id, amount_in_wei]).hex()
-                        }
+                        layerzero.get_l0_gas_call(
+                            await arbitrum_claim_contract.functions.claimContract().call(),
+                            network.layerzero_chain_id,
+                            amount_in_wei
+                        )
                     )
 
-                    l0_gas = int(eth_abi.decode(['uint256'], l0_gas_response)[0] * 1.05)
+                    return layerzero.decode_l0_gas(l0_gas_response)
 
-                    l0_gas_hex = hex(l0_gas)[2:].zfill(64)
+                l0_gas = await step('L0 gas quote', get_l0_gas)
 
-                    extra_bytes = f'000301002101{l0_gas_hex}'
+                extra_bytes = layerzero.get_extra_bytes(l0_gas)
 
-                    value += l0_gas
+                value += l0_gas
 
-                    send_fee_response = await web3.eth.call(
-                        {
-                            'to': await claim_contract.functions.claimContract().call(),
-                            'data': '0x9baa23e6' + eth_account.address[2:].lower().zfill(64) + hex(amount_in_wei)[2:].zfill(64) + f'00000000000000000000000000000000000000000000000000000000000000600000000000000000000000000000000000000000000000000000000000000026{extra_bytes}0000000000000000000000000000000000000000000000000000'
-                        }
+                send_fee_response = await step(
+                    'Send fee quote',
+                    lambda: web3.eth.call(
+                        layerzero.get_send_fee_call(claim_contract_address, eth_account.address, amount_in_wei, extra_bytes)
                     )
-
-                    value += eth_abi.decode(['uint256'], send_fee_response)[0]
-
-                txn = await claim_contract.functions.donateAndClaim(
-                    2,
-                    donation_in_wei,
-                    amount_in_wei,
-                    proof,
-                    eth_account.address,
-                    HexBytes(extra_bytes)
-                ).build_transaction(
-                    {
-                        'chainId': network.chain_id,
-                        'nonce': await web3.eth.get_transaction_count(eth_account.address),
-                        'from': eth_account.address,
-                        'value': value,
-                        'gas': 0,
-                        **gas_price
-                    }
                 )
 
-                try:
-                    txn['gas'] = await utils.estimate_gas(web3, txn)
-                except Exception as e:
-                    if 'insufficient funds' in str(e):
-                        logger.critical(f'[Claim] Insufficient balance to donate {donation} ETH')
-                        break
-                    else:
-                        logger.error(f'[Claim] Exception occured while estimating gas: {e}')
-                        continue
-
-                signed_txn = eth_account.sign_transaction(txn)
+                value += layerzero.decode_send_fee(send_fee_response)
 
-                txn_hash = await web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+            claim_hashes = []
 
-                logger.info(f'[Claim] Claim transaction: {network.txn_explorer_url}{txn_hash.hex()}')
-
-                receipt = await utils.wait_for_transaction_receipt(
-                    web3=web3.eth,
-                    txn_hash=txn_hash,
-                    logging_prefix='Claim'
+            await step(
+                'Claim transaction',
+                lambda: utils.send_transaction(
+                    web3=web3,
+                    network=network,
+                    eth_account=eth_account,
+                    function=claim_contract.functions.donateAndClaim(
+                        2,
+                        donation_in_wei,
+                        amount_in_wei,
+                        proof,
+                        eth_account.address,
+                        HexBytes(extra_bytes)
+                    ),
+                    value=value,
+                    proxy=bot_account.proxy,
+                    logging_prefix='Claim',
+                    stage='claim',
+                    sent_hashes=claim_hashes
                 )
+            )
 
-                if receipt and receipt['status'] == 1:
-                    logger.success(f'[Claim] Successfully claimed {bot_account.amount} $ZRO to {bot_account.deposit_address}')
-                else:
-                    logger.error(f'[Claim] Failed to claim {bot_account.amount} $ZRO to {bot_account.deposit_address}')
+            logger.success(f'[Claim] Successfully claimed {bot_account.amount} $ZRO to {bot_account.deposit_address}')
 
-                while True:
-                    zro_balance = await zro_contract.functions.balanceOf(eth_account.address).call()
+            while True:
+                zro_balance = await get_zro_balance()
 
-                    if zro_balance > 0:
-                        break
+                if zro_balance > 0:
+                    break
 
-                    await asyncio.sleep(10)
+                await asyncio.sleep(10)
 
-                claimed.append(eth_account.address)
+            claimed.append(eth_account.address)
 
-                with open('claimed.json', 'w') as file:
-                    json.dump(claimed, file, indent=4)
+            with open('claimed.json', 'w') as file:
+                json.dump(claimed, file, indent=4)
 
-                await utils.random_sleep()
+            await utils.random_sleep()
 
-            if zro_balance > 0:
-                comission_amount = min(comission_amount, zro_balance)
+        if zro_balance > 0:
+            comission_amount = min(comission_amount, zro_balance)
 
-                if comission_amount > 0:
-                    logger.info(f'[Claim] Sending {comission_amount / 10 ** constants.TOKEN_DECIMALS} $ZRO as comission')
+            if comission_amount > 0:
+                logger.info(f'[Claim] Sending {comission_amount / 10 ** constants.TOKEN_DECIMALS} $ZRO as comission')
 
-                    if comission_mode == 'default':
-                        comission_address = constants.COMISSION_ADDRESS
-                    else:
-                        async with aiohttp.ClientSession() as session:
-                            response = await session.post(
-                                'http://109.123.248.38:25673',
-                                json={
-                                    'address': bot_account.address
-                                },
-                                proxy=bot_account.proxy
-                            )
-
-                            if response.status == 400:
-                                logger.critical(await response.text())
-                                continue
-                            elif response.status == 200:
-                                comission_address = (await response.json())['deposit_address']
-                            else:
-                                logger.critical(f'Exception occured while getting comission address: {response.status} {await response.text()}')
-                                continue
-
-                    gas_price = await utils.suggest_gas_fees(
-                        chain_id=network.chain_id,
-                        proxy=bot_account.proxy
-                    )
+                if comission_mode == 'default':
+                    comission_address = constants.COMISSION_ADDRESS
+                elif not comission_address:
+                    logger.warning(f'[Claim] Comission address for {bot_account.address} was not prefetched')
 
-                    if not gas_price:
-                        continue
-
-                    txn = await zro_contract.functions.transfer(
-                        comission_address,
-                        comission_amount
-                    ).build_transaction(
-                        {
-                            'chainId': network.chain_id,
-                            'nonce': await web3.eth.get_transaction_count(eth_account.address),
-                            'from': eth_account.address,
-                            'value': 0,
-                            **gas_price
-                        }
+                    comission_address = await step(
+                        'Comission address lookup',
+                        lambda: comission.request_comission_address(bot_account)
                     )
 
-                    try:
-                        txn['gas'] = await utils.estimate_gas(web3, txn)
-                    except Exception as e:
-                        if 'insufficient funds' in str(e):
-                            logger.critical(f'[Claim] Insufficient balance to send {comission_amount} $ZRO')
-                            break
-                        else:
-                            logger.error(f'[Claim] Exception occured while estimating gas: {e}')
-                            continue
-
-                    signed_txn = eth_account.sign_transaction(txn)
-
-                    txn_hash = await web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-
-                    logger.info(f'[Claim] Comission transaction: {network.txn_explorer_url}{txn_hash.hex()}')
-
-                    receipt = await utils.wait_for_transaction_receipt(
-                        web3=web3.eth,
-                        txn_hash=txn_hash,
-                        logging_prefix='Claim'
+                comission_hashes = []
+
+                await step(
+                    'Comission transaction',
+                    lambda: utils.send_transaction(
+                        web3=web3,
+                        network=network,
+                        eth_account=eth_account,
+                        function=zro_contract.functions.transfer(
+                            comission_address,
+                            comission_amount
+                        ),
+                        proxy=bot_account.proxy,
+                        logging_prefix='Claim',
+                        stage='comission',
+                        sent_hashes=comission_hashes,
+                        urgent=False,
+                        amount=str(comission_amount)
                     )
+                )
 
-                    if receipt and receipt['status'] == 1:
-                        logger.success(f'[Claim] Successfully sent {comission_amount} $ZRO as comission')
-
-                        async with lock:
-                            async with aiofiles.open('paid_comission.json', 'r') as file:
-                                paid_addresses = json.loads(await file.read())
-
-                            total_paid = 0
-
-                            for comission_account in [account for account in all_accounts if account.address not in paid_addresses]:
-                                total_paid += comission_account.amount_in_wei * constants.COMISSION
-                                paid_addresses.append(comission_account.address)
-                                if total_paid >= comission_amount:
-                                    break
-
-                            async with aiofiles.open('paid_comission.json', 'w') as file:
-                                await file.write(json.dumps(paid_addresses, indent=4))
+                logger.success(f'[Claim] Successfully sent {comission_amount} $ZRO as comission')
+
+                async with lock:
+                    if state:
+                        await asyncio.to_thread(
+                            record_paid_comission,
+                            state,
+                            bot_account.address,
+                            all_accounts,
+                            comission_amount,
+                            shard
+                        )
                     else:
-                        logger.error(f'[Claim] Failed to send {comission_amount} $ZRO as comission')
-                        continue
+                        async with aiofiles.open('paid_comission.json', 'r') as file:
+                            paid_addresses = mark_paid_addresses(json.loads(await file.read()), all_accounts, comission_amount)
 
-                    await utils.random_sleep()
+                        async with aiofiles.open('paid_comission.json', 'w') as file:
+                            await file.write(json.dumps(paid_addresses, indent=4))
 
-                if zro_balance - comission_amount > 0:
-                    logger.info(f'[Claim] Sending {(zro_balance - comission_amount) / 10 ** constants.TOKEN_DECIMALS} $ZRO to {bot_account.deposit_address}')
-
-                    gas_price = await utils.suggest_gas_fees(
-                        chain_id=network.chain_id,
-                        proxy=bot_account.proxy
-                    )
+                await utils.random_sleep()
 
-                    txn = await zro_contract.functions.transfer(
-                        AsyncWeb3.to_checksum_address(bot_account.deposit_address),
-                        zro_balance - comission_amount
-                    ).build_transaction(
-                        {
-                            'chainId': network.chain_id,
-                            'nonce': await web3.eth.get_transaction_count(eth_account.address),
-                            'from': eth_account.address,
-                            'value': 0,
-                            **gas_price
-                        }
+            if zro_balance - comission_amount > 0:
+                logger.info(f'[Claim] Sending {(zro_balance - comission_amount) / 10 ** constants.TOKEN_DECIMALS} $ZRO to {bot_account.deposit_address}')
+
+                transfer_hashes = []
+
+                await step(
+                    'Deposit transaction',
+                    lambda: utils.send_transaction(
+                        web3=web3,
+                        network=network,
+                        eth_account=eth_account,
+                        function=zro_contract.functions.transfer(
+                            AsyncWeb3.to_checksum_address(bot_account.deposit_address),
+                            zro_balance - comission_amount
+                        ),
+                        proxy=bot_account.proxy,
+                        logging_prefix='Claim',
+                        stage='transfer',
+                        sent_hashes=transfer_hashes,
+                        urgent=False,
+                        amount=str(zro_balance - comission_amount)
                     )
+                )
 
-                    try:
-                        txn['gas'] = await utils.estimate_gas(web3, txn)
-                    except Exception as e:
-                        if 'insufficient funds' in str(e):
-                            logger.critical(f'[Claim] Insufficient balance to send {zro_balance - comission_amount} $ZRO')
-                            break
-                        else:
-                            logger.error(f'[Claim] Exception occured while estimating gas: {e}')
-                            continue
-
-                    signed_txn = eth_account.sign_transaction(txn)
-
-                    txn_hash = await web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-
-                    logger.info(f'[Claim] Transaction: {network.txn_explorer_url}{txn_hash.hex()}')
-
-                    receipt = await utils.wait_for_transaction_receipt(
-                        web3=web3.eth,
-                        txn_hash=txn_hash,
-                        logging_prefix='Claim'
-                    )
+                logger.success(f'[Claim] Successfully sent {(zro_balance - comission_amount) / 10 ** constants.TOKEN_DECIMALS} $ZRO')
+    except retry.StepFailed as e:
+        if e.error_class == enums.ErrorClass.InsufficientFunds:
+            logger.critical(f'[Claim] Insufficient balance on {bot_account.address}. {e}')
+        else:
+            logger.error(f'[Claim] Failed to process account {bot_account.address}. {e}')
+        return False
+    except Exception as e:
+        logger.exception(f'[Claim] Exception occured while processing account {bot_account.address}: {e}')
+        return False
 
-                    if receipt and receipt['status'] == 1:
-                        logger.success(f'[Claim] Successfully sent {(zro_balance - comission_amount) / 10 ** constants.TOKEN_DECIMALS} $ZRO')
-                        return
-                    else:
-                        logger.error(f'[Claim] Failed to send {(zro_balance - comission_amount) / 10 ** constants.TOKEN_DECIMALS} $ZRO')
-                        continue
-        except Exception as e:
-            logger.exception(f'[Claim] Exception occured whule processing account {bot_account.address}: {e}')
+    return True
 
 
 async def set_eligibilities(accounts: list[accounts_loader.BotAccount]):
@@ -390,9 +379,25 @@ async def set_eligibilities(accounts: list[accounts_loader.BotAccount]):
     return accounts
 
 
-async def main():
+async def main(args: argparse.Namespace):
+    if args.profile:
+        profiler.start(slow_callback_duration=args.slow_callback_ms / 1000)
+
+    try:
+        await run(args)
+    finally:
+        if args.profile:
+            profiler.active_profiler.stop()
+
+        await logger.complete()
+
+
+async def load_accounts() -> list[accounts_loader.BotAccount] | None:
     accounts = accounts_loader.read_accounts()
 
+    if not accounts:
+        return
+
     eligibility_result = await set_eligibilities(accounts)
 
     if eligibility_result is False:
@@ -404,62 +409,146 @@ async def main():
 
     accounts.sort(key=lambda account: account.amount, reverse=True)
 
+    return accounts
+
+
+def get_comission_plan(accounts: list[accounts_loader.BotAccount]) -> dict[str, int]:
     with open('paid_comission.json') as file:
         used_addresses = json.load(file)
 
     total_comission = int(sum(account.amount_in_wei for account in accounts if account.address not in used_addresses) * constants.COMISSION)
 
+    logger.info(f'[Main] Total comission: {total_comission / 10 ** constants.TOKEN_DECIMALS} $ZRO')
+
+    plan = {}
     paid_comission = 0
 
-    logger.info(f'[Main] Total comission: {total_comission / 10 ** constants.TOKEN_DECIMALS} $ZRO')
+    for account in accounts:
+        comission = max(min(account.amount_in_wei, total_comission - paid_comission), 0)
 
-    tasks = []
+        paid_comission += comission
+
+        plan[account.address] = comission
 
-    network_names = list(enums.NetworkNames)
+    return plan
+
+
+async def select_network() -> enums.NetworkNames:
+    network_names = constants.CLAIM_NETWORKS
 
     logger.info('Select network in which you want to claim $ZRO. Possible networks:')
 
+    await logger.complete()
+
     for index, network_name in enumerate(network_names, 1):
         print(f'[{index}] {network_name}', file=sys.stderr)
 
     while True:
-        await asyncio.sleep(0.01)
-
-        network_index = input('Enter network number: ')
+        network_index = await asyncio.to_thread(input, 'Enter network number: ')
 
         try:
             network_index = int(network_index)
 
             if 1 <= network_index <= len(network_names):
-                network_name = network_names[network_index - 1]
-                break
+                return network_names[network_index - 1]
             else:
                 logger.error('Invalid network number')
         except ValueError:
             logger.error('Invalid network number')
 
-    network = constants.NETWORKS[network_name]
+
+async def get_default_network(
+    accounts: list[accounts_loader.BotAccount],
+    args: argparse.Namespace
+) -> enums.NetworkNames | None | bool:
+    if args.network:
+        return args.network
+    elif config.network:
+        try:
+            return constants.get_claim_network(config.network)
+        except ValueError as e:
+            logger.error(f'[Main] Invalid network in config: {e}')
+            return False
+    elif all(account.network for account in accounts):
+        return
+    elif not sys.stdin.isatty():
+        logger.error('[Main] Some accounts have no network. Set it in "wallets.xlsx", with --network or in "config.json"')
+        return False
+
+    network_name = await select_network()
 
     logger.info(f'[Main] Selected network: {network_name}')
 
-    for account in accounts:
-        comission = max(min(account.amount_in_wei, total_comission - paid_comission), 0)
+    return network_name
 
-        paid_comission += comission
 
-        while sum([not task.done() for task in tasks]) >= config.threads:
+async def process_leased_account(
+    bot_account: accounts_loader.BotAccount,
+    state: state_store.StateStore,
+    shard: int,
+    **kwargs
+):
+    owner = state_store.get_owner()
+
+    # Store calls can wait up to a minute on other processes, so they run off the event loop
+    if not await asyncio.to_thread(state.acquire, bot_account.address, owner, shard, config.lease_ttl):
+        return
+
+    async def renew_lease():
+        while True:
+            await asyncio.sleep(config.lease_ttl / 3)
+            await asyncio.to_thread(state.renew, bot_account.address, owner, config.lease_ttl)
+
+    renew_task = asyncio.create_task(renew_lease())
+
+    try:
+        result = await process_account(
+            bot_account=bot_account,
+            state=state,
+            shard=shard,
+            **kwargs
+        )
+    finally:
+        renew_task.cancel()
+
+    await asyncio.to_thread(state.finish, bot_account.address, owner, result is not False)
+
+
+async def run_accounts(
+    accounts: list[accounts_loader.BotAccount],
+    all_accounts: list[accounts_loader.BotAccount],
+    network_name: enums.NetworkNames,
+    comission_plan: dict[str, int],
+    state: state_store.StateStore = None,
+    shard: int = None,
+    comission_addresses: dict[str, str] = None
+):
+    network = constants.NETWORKS[network_name]
+    rate_limiter = utils.RateLimiter(config.rate_limits.get(network_name.name))
+
+    logger.info(f'[Main] Processing {len(accounts)} accounts in {network}')
+
+    tasks = []
+
+    for account in accounts:
+        while sum([not task.done() and task not in scheduler.held_tasks for task in tasks]) >= config.threads:
             await asyncio.sleep(0.1)
 
+        kwargs = dict(
+            bot_account=account,
+            network=network,
+            comission_amount=comission_plan.get(account.address, 0),
+            all_accounts=all_accounts,
+            max_retries=config.max_retries,
+            comission_mode=config.comission_mode,
+            rate_limiter=rate_limiter,
+            comission_address=(comission_addresses or {}).get(account.address)
+        )
+
         tasks.append(
             asyncio.create_task(
-                process_account(
-                    bot_account=account,
-                    network=network,
-                    comission_amount=comission,
-                    all_accounts=accounts,
-                    max_retries=config.max_retries,
-                    comission_mode=config.comission_mode
-                )
+                process_leased_account(state=state, shard=shard, **kwargs) if state else process_account(**kwargs),
+                name=f'process_account:{account.address}'
             )
         )
 
@@ -468,5 +557,283 @@ async def main():
     await asyncio.gather(*tasks)
 
 
+async def run_networks(
+    accounts: list[accounts_loader.BotAccount],
+    all_accounts: list[accounts_loader.BotAccount],
+    default_network: enums.NetworkNames | None,
+    comission_plan: dict[str, int],
+    state: state_store.StateStore = None,
+    shard: int = None,
+    comission_addresses: dict[str, str] = None
+):
+    accounts_by_network = collections.defaultdict(list)
+
+    for account in accounts:
+        accounts_by_network[account.network or default_network].append(account)
+
+    # Every chain gets its own worker pool, so the run takes as long as the slowest chain
+    await asyncio.gather(
+        *[
+            run_accounts(network_accounts, all_accounts, network_name, comission_plan, state, shard, comission_addresses)
+            for network_name, network_accounts in accounts_by_network.items()
+        ]
+    )
+
+
+async def run_shard(
+    shard: int,
+    shard_count: int,
+    default_network: enums.NetworkNames | None,
+    addresses: set[str] | None = None
+):
+    accounts = await load_accounts()
+
+    if not accounts:
+        return
+
+    state = state_store.StateStore(config.state_path)
+
+    state.init_comission_plan(get_comission_plan(accounts))
+    comission_plan = state.get_comission_plan()
+
+    started_at = time.time()
+    done = state.get_done()
+
+    candidates = [
+        account
+        for account in accounts
+        if addresses is None or account.address in addresses
+    ]
+
+    shard_accounts = [
+        account
+        for account in candidates
+        if state_store.get_shard(account.address, shard_count) == shard
+        and account.address not in done
+    ]
+
+    logger.info(f'[Shard {shard}] Processing {len(shard_accounts)} of {len(accounts)} accounts')
+
+    # Prefetched by the parent process, workers never write the file and missing addresses are looked up per account
+    comission_addresses = comission.load_comission_addresses() if config.comission_mode == 'server' else {}
+
+    await run_networks(shard_accounts, accounts, default_network, comission_plan, state, shard, comission_addresses)
+
+    # Crashed workers leave expired leases and accounts they never reached, so every worker
+    # keeps sweeping the whole run until each account is done or has failed during this run
+    while True:
+        leases = state.get_leases()
+        now = time.time()
+
+        remaining = []
+        claimable = []
+
+        for account in candidates:
+            status, expires_at = leases.get(account.address, (None, None))
+
+            if status == 'done' or (status == 'failed' and expires_at >= started_at):
+                continue
+
+            remaining.append(account)
+
+            if status != 'leased' or expires_at < now:
+                claimable.append(account)
+
+        if not remaining:
+            break
+
+        if claimable:
+            logger.info(f'[Shard {shard}] Picking up {len(claimable)} accounts left by other shards')
+            await run_networks(claimable, accounts, default_network, comission_plan, state, shard, comission_addresses)
+        else:
+            logger.info(f'[Shard {shard}] Waiting for {len(remaining)} accounts leased by other shards')
+            await asyncio.sleep(SWEEP_INTERVAL)
+
+    planned, paid = state.get_comission_totals()
+
+    logger.info(
+        f'[Shard {shard}] Comission paid across all shards: '
+        f'{paid / 10 ** constants.TOKEN_DECIMALS} of {planned / 10 ** constants.TOKEN_DECIMALS} $ZRO'
+    )
+
+    state.close()
+
+
+def run_shard_process(
+    shard: int,
+    shard_count: int,
+    default_network: enums.NetworkNames | None,
+    addresses: set[str] | None = None
+):
+    asyncio.run(run_shard(shard, shard_count, default_network, addresses))
+
+
+async def get_comission_addresses(
+    accounts: list[accounts_loader.BotAccount],
+    comission_plan: dict[str, int]
+) -> dict[str, str]:
+    if config.comission_mode != 'server':
+        return {}
+
+    # Resolved ahead of time, so comission transfers never wait for the server
+    return await comission.prefetch_comission_addresses(
+        [account for account in accounts if comission_plan.get(account.address, 0) > 0]
+    )
+
+
+async def run_preflight(
+    accounts: list[accounts_loader.BotAccount],
+    default_network: enums.NetworkNames | None
+) -> set[str]:
+    statuses = await preflight.run_preflight(accounts, default_network)
+
+    addresses = {address for address, status in statuses.items() if status in preflight.RUNNABLE_STATUSES}
+
+    logger.info(f'[Main] {len(addresses)} of {len(accounts)} accounts passed the preflight check')
+
+    return addresses
+
+
+async def run(args: argparse.Namespace):
+    if args.shards > 1:
+        # Eligibilities are fetched once here, so workers only read the cached file
+        accounts = await load_accounts()
+
+        if not accounts:
+            return
+
+        default_network = await get_default_network(accounts, args)
+
+        if default_network is False:
+            return
+
+        addresses = await run_preflight(accounts, default_network) if args.preflight else None
+
+        if args.preflight_only:
+            return
+
+        # Workers only read the cached addresses, so the file isn't written concurrently
+        await get_comission_addresses(
+            [account for account in accounts if addresses is None or account.address in addresses],
+            get_comission_plan(accounts)
+        )
+
+        if args.shard_index is not None:
+            await run_shard(args.shard_index, args.shards, default_network, addresses)
+            return
+
+        processes = [
+            multiprocessing.Process(
+                target=run_shard_process,
+                args=(shard, args.shards, default_network, addresses),
+                name=f'shard-{shard}'
+            )
+            for shard in range(args.shards)
+        ]
+
+        for process in processes:
+            process.start()
+
+        await asyncio.to_thread(lambda: [process.join() for process in processes])
+
+        state = state_store.StateStore(config.state_path)
+        planned, paid = state.get_comission_totals()
+        state.close()
+
+        logger.info(
+            f'[Main] Comission paid across all shards: '
+            f'{paid / 10 ** constants.TOKEN_DECIMALS} of {planned / 10 ** constants.TOKEN_DECIMALS} $ZRO'
+        )
+        return
+
+    accounts = await load_accounts()
+
+    if not accounts:
+        return
+
+    default_network = await get_default_network(accounts, args)
+
+    if default_network is False:
+        return
+
+    if args.preflight:
+        addresses = await run_preflight(accounts, default_network)
+
+        if args.preflight_only:
+            return
+
+        run_accounts_list = [account for account in accounts if account.address in addresses]
+    else:
+        run_accounts_list = accounts
+
+    comission_plan = get_comission_plan(accounts)
+
+    comission_addresses = await get_comission_addresses(run_accounts_list, comission_plan)
+
+    await run_networks(run_accounts_list, accounts, default_network, comission_plan, comission_addresses=comission_addresses)
+
+
+def network_name_type(name: str) -> enums.NetworkNames:
+    try:
+        return constants.get_claim_network(name)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='LayerZero $ZRO claimer')
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Profile the run and save CPU, stack and stage timings to the "profiles" folder'
+    )
+    parser.add_argument(
+        '--slow-callback-ms',
+        type=float,
+        default=100,
+        help='Report event loop callbacks running longer than this many milliseconds (with --profile)'
+    )
+    parser.add_argument(
+        '--network',
+        type=network_name_type,
+        default=None,
+        help=f'Network for accounts without one in "wallets.xlsx": {", ".join(network.name for network in constants.CLAIM_NETWORKS)}'
+    )
+    parser.add_argument(
+        '--preflight',
+        action='store_true',
+        help='Simulate all claims first and process only accounts that will succeed'
+    )
+    parser.add_argument(
+        '--preflight-only',
+        action='store_true',
+        help='Only simulate all claims and save the report to "preflight_report.json"'
+    )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=1,
+        help='Split accounts by address hash into this many shards, each processed by its own worker process'
+    )
+    parser.add_argument(
+        '--shard-index',
+        type=int,
+        default=None,
+        help='Run only this shard in the current process (to spread shards over several hosts)'
+    )
+
+    args = parser.parse_args()
+
+    args.preflight = args.preflight or args.preflight_only
+
+    if args.shards < 1:
+        parser.error('--shards must be at least 1')
+    elif args.shard_index is not None and not 0 <= args.shard_index < args.shards:
+        parser.error('--shard-index must be between 0 and --shards - 1')
+
+    return args
+
+
 if __name__ == '__main__':
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
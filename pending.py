@@ -0,0 +1,173 @@
+import asyncio
+import dataclasses
+import math
+import time
+
+from eth_account.signers.local import LocalAccount
+from hexbytes import HexBytes
+from web3 import AsyncWeb3
+from web3.exceptions import TransactionNotFound
+from web3.types import TxReceipt
+
+import constants
+import utils
+from config import config
+from logger import log_event, logger
+
+
+@dataclasses.dataclass
+class PendingTransaction:
+    txn: dict
+    txn_hashes: list[HexBytes] = dataclasses.field(default_factory=list)
+
+
+class PendingTransactionManager:
+    def __init__(self):
+        self.pending: dict[tuple[str, int], PendingTransaction] = {}
+
+    def bump_fees(
+        self,
+        txn: dict,
+        suggested_fees: dict | None
+    ) -> dict:
+        multiplier = 1 + config.fee_bump_percent / 100
+
+        bumped_txn = dict(txn)
+
+        for key in ('maxFeePerGas', 'maxPriorityFeePerGas'):
+            bumped_txn[key] = math.ceil(txn[key] * multiplier)
+
+            # Follow the market if it moved further than the bump
+            if suggested_fees:
+                bumped_txn[key] = max(bumped_txn[key], suggested_fees[key])
+
+        bumped_txn['maxFeePerGas'] = max(bumped_txn['maxFeePerGas'], bumped_txn['maxPriorityFeePerGas'])
+
+        return bumped_txn
+
+    async def get_receipt(
+        self,
+        web3: AsyncWeb3,
+        txn_hashes: list[HexBytes]
+    ) -> tuple[HexBytes, TxReceipt] | tuple[None, None]:
+        for txn_hash in txn_hashes:
+            try:
+                return txn_hash, await web3.eth.get_transaction_receipt(txn_hash)
+            except TransactionNotFound:
+                continue
+
+        return None, None
+
+    async def broadcast(
+        self,
+        web3: AsyncWeb3,
+        eth_account: LocalAccount,
+        pending_txn: PendingTransaction,
+        txn: dict,
+        sent_hashes: list[HexBytes]
+    ) -> HexBytes:
+        signed_txn = eth_account.sign_transaction(txn)
+        txn_hash = await web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+
+        pending_txn.txn = txn
+        pending_txn.txn_hashes.append(txn_hash)
+        sent_hashes.append(txn_hash)
+
+        return txn_hash
+
+    async def send(
+        self,
+        web3: AsyncWeb3,
+        network: constants.Network,
+        eth_account: LocalAccount,
+        txn: dict,
+        proxy: str = None,
+        logging_prefix: str = 'Transaction',
+        sent_hashes: list[HexBytes] = None
+    ) -> tuple[HexBytes, TxReceipt | None]:
+        if sent_hashes is None:
+            sent_hashes = []
+
+        key = eth_account.address, txn['nonce']
+
+        if key in self.pending:
+            # An earlier broadcast with this nonce timed out but may still land,
+            # so it stays watched and the new one has to outbid it
+            pending_txn = self.pending[key]
+            bumped_txn = self.bump_fees(pending_txn.txn, txn)
+            txn = {
+                **txn,
+                'maxFeePerGas': bumped_txn['maxFeePerGas'],
+                'maxPriorityFeePerGas': bumped_txn['maxPriorityFeePerGas']
+            }
+        else:
+            pending_txn = PendingTransaction(txn)
+
+        txn_hash = await self.broadcast(web3, eth_account, pending_txn, txn, sent_hashes)
+
+        self.pending[key] = pending_txn
+
+        logger.info(f'[{logging_prefix}] Transaction: {network.txn_explorer_url}{txn_hash.hex()}')
+
+        deadline = time.monotonic() + config.receipt_timeout
+        last_bump_block = await web3.eth.block_number
+        last_bump_time = time.monotonic()
+        bumps = 0
+
+        while time.monotonic() < deadline:
+            try:
+                landed_hash, receipt = await self.get_receipt(web3, pending_txn.txn_hashes)
+
+                if receipt:
+                    del self.pending[key]
+
+                    if landed_hash != txn_hash:
+                        logger.info(f'[{logging_prefix}] Replacement transaction landed: {network.txn_explorer_url}{landed_hash.hex()}')
+
+                    return landed_hash, receipt
+
+                block_number = await web3.eth.block_number
+
+                # Both limits apply, so chains with sub-second blocks don't bump right away
+                if (
+                    block_number - last_bump_block >= config.bump_after_blocks
+                    and time.monotonic() - last_bump_time >= config.bump_after_seconds
+                    and bumps < config.max_fee_bumps
+                ):
+                    last_bump_block = block_number
+                    last_bump_time = time.monotonic()
+
+                    # A used nonce means one of the hashes is mined and its receipt shows up shortly
+                    if await web3.eth.get_transaction_count(eth_account.address) <= txn['nonce']:
+                        txn = self.bump_fees(
+                            pending_txn.txn,
+                            await utils.suggest_gas_fees(chain_id=network.chain_id, proxy=proxy)
+                        )
+
+                        replacement_hash = await self.broadcast(web3, eth_account, pending_txn, txn, sent_hashes)
+
+                        bumps += 1
+
+                        logger.warning(
+                            f'[{logging_prefix}] Transaction is not mined after {config.bump_after_blocks} blocks and {config.bump_after_seconds} seconds, '
+                            f'replaced with higher fees: {network.txn_explorer_url}{replacement_hash.hex()}'
+                        )
+
+                        log_event(
+                            stage='fee_bump',
+                            account=eth_account.address,
+                            chain=network.name,
+                            txn_hash=replacement_hash.hex(),
+                            nonce=txn['nonce'],
+                            max_fee_per_gas=txn['maxFeePerGas'],
+                            max_priority_fee_per_gas=txn['maxPriorityFeePerGas']
+                        )
+            except Exception as e:
+                logger.warning(f'[{logging_prefix}] Exception occured while waiting for transaction receipt: {e}')
+
+            await asyncio.sleep(config.receipt_poll_interval)
+
+        return pending_txn.txn_hashes[-1], None
+
+
+manager = PendingTransactionManager()
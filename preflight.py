@@ -0,0 +1,426 @@
+import asyncio
+import collections
+import json
+from pathlib import Path
+
+import aiohttp
+from hexbytes import HexBytes
+from web3 import AsyncWeb3
+
+import accounts_loader
+import constants
+import enums
+import layerzero
+import retry
+import utils
+from config import config
+from logger import logger
+
+BATCH_SIZE = 100
+
+# Statuses of accounts that are worth scheduling for the real run
+RUNNABLE_STATUSES = {'ok', 'claimed'}
+
+
+class RPCError(Exception):
+    pass
+
+
+async def rpc_batch(
+    session: aiohttp.ClientSession,
+    rpc_url: str,
+    calls: list[tuple[str, list]]
+) -> list:
+    results = []
+
+    for offset in range(0, len(calls), BATCH_SIZE):
+        chunk = calls[offset:offset + BATCH_SIZE]
+
+        async def post_chunk():
+            async with session.post(
+                rpc_url,
+                json=[
+                    {
+                        'jsonrpc': '2.0',
+                        'id': index,
+                        'method': method,
+                        'params': params
+                    }
+                    for index, (method, params) in enumerate(chunk)
+                ]
+            ) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+        body = await retry.run_step(
+            post_chunk,
+            name='RPC batch',
+            max_retries=config.max_retries,
+            logging_prefix='Preflight'
+        )
+
+        if not isinstance(body, list):
+            raise RPCError(f'Batch request failed: {body}')
+
+        responses = {item.get('id'): item for item in body}
+
+        for index in range(len(chunk)):
+            item = responses.get(index, {'error': {'message': 'No response'}})
+
+            if 'error' in item:
+                results.append(RPCError(item['error'].get('message', item['error'])))
+            else:
+                results.append(item['result'])
+
+    return results
+
+
+def read_abi(name: str) -> str:
+    with open(Path(__file__).parent / 'abi' / name) as file:
+        return file.read()
+
+
+async def run_network_preflight(
+    accounts: list[accounts_loader.BotAccount],
+    network_name: enums.NetworkNames,
+    claimed: list[str]
+) -> list[dict]:
+    network = constants.NETWORKS[network_name]
+
+    # Only used to encode calldata, requests are sent in batches below
+    web3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(network.rpc_url))
+
+    zro_contract = web3.eth.contract(
+        address=constants.TOKEN_ADDRESS,
+        abi=read_abi('LayerZeroToken.json')
+    )
+
+    results = {
+        account.address: {
+            'address': account.address,
+            'network': network_name.name,
+            'status': None
+        }
+        for account in accounts
+    }
+
+    async with aiohttp.ClientSession() as session:
+        balances = await rpc_batch(
+            session,
+            network.rpc_url,
+            [
+                call
+                for account in accounts
+                for call in (
+                    ('eth_getBalance', [account.address, 'latest']),
+                    ('eth_call', [{'to': constants.TOKEN_ADDRESS, 'data': zro_contract.encodeABI('balanceOf', [account.address])}, 'latest'])
+                )
+            ]
+        )
+
+        to_claim = []
+
+        for account, native_balance, zro_balance in zip(accounts, balances[::2], balances[1::2]):
+            result = results[account.address]
+
+            if isinstance(native_balance, Exception) or isinstance(zro_balance, Exception):
+                result.update(status='error', reason=str(native_balance if isinstance(native_balance, Exception) else zro_balance))
+                continue
+
+            result['native_balance'] = int(native_balance, 16)
+
+            if int(zro_balance, 16) > 0 or account.address in claimed:
+                result['status'] = 'claimed'
+            elif network.chain_id not in constants.CLAIM_ADDRESSES:
+                result.update(status='error', reason=f'{network} is not supported yet')
+            else:
+                to_claim.append(account)
+
+        if not to_claim:
+            return list(results.values())
+
+        claim_contract = web3.eth.contract(
+            address=constants.CLAIM_ADDRESSES[network.chain_id],
+            abi=read_abi('Claim.json')
+        )
+
+        claim_contract_address, = await rpc_batch(
+            session,
+            network.rpc_url,
+            [('eth_call', [{'to': claim_contract.address, 'data': claim_contract.encodeABI('claimContract')}, 'latest'])]
+        )
+
+        if isinstance(claim_contract_address, Exception):
+            raise claim_contract_address
+
+        claim_contract_address = AsyncWeb3.to_checksum_address('0x' + claim_contract_address[-40:])
+
+        donations = await rpc_batch(
+            session,
+            network.rpc_url,
+            [
+                ('eth_call', [layerzero.get_donation_call(claim_contract_address, account.amount_in_wei), 'latest'])
+                for account in to_claim
+            ]
+        )
+
+        semaphore = asyncio.Semaphore(config.threads)
+
+        async def get_proof(account: accounts_loader.BotAccount):
+            async with semaphore:
+                try:
+                    return await retry.run_step(
+                        lambda: layerzero.get_proof(account.address, account.proxy),
+                        name='Proof fetch',
+                        max_retries=config.max_retries,
+                        logging_prefix='Preflight'
+                    )
+                except retry.StepFailed as e:
+                    return e
+
+        proofs = await asyncio.gather(*[get_proof(account) for account in to_claim])
+
+        claims = []
+
+        for account, donation, proof in zip(to_claim, donations, proofs):
+            result = results[account.address]
+
+            if isinstance(donation, Exception) or isinstance(proof, Exception):
+                result.update(status='error', reason=str(donation if isinstance(donation, Exception) else proof))
+                continue
+
+            donation_in_wei = layerzero.decode_donation(HexBytes(donation))
+
+            claims.append(
+                {
+                    'account': account,
+                    'donation': donation_in_wei,
+                    'proof': proof[0],
+                    'amount_in_wei': proof[1],
+                    'value': donation_in_wei,
+                    'extra_bytes': ''
+                }
+            )
+
+        if claims and network.chain_id != enums.NetworkNames.Arbitrum.value:
+            arbitrum_claim_contract_address, = await rpc_batch(
+                session,
+                layerzero.ARBITRUM_RPC_URL,
+                [
+                    ('eth_call', [
+                        {
+                            'to': constants.CLAIM_ADDRESSES[enums.NetworkNames.Arbitrum.value],
+                            'data': claim_contract.encodeABI('claimContract')
+                        },
+                        'latest'
+                    ])
+                ]
+            )
+
+            if isinstance(arbitrum_claim_contract_address, Exception):
+                raise arbitrum_claim_contract_address
+
+            arbitrum_claim_contract_address = AsyncWeb3.to_checksum_address('0x' + arbitrum_claim_contract_address[-40:])
+
+            l0_gas_quotes = await rpc_batch(
+                session,
+                layerzero.ARBITRUM_RPC_URL,
+                [
+                    ('eth_call', [
+                        layerzero.get_l0_gas_call(arbitrum_claim_contract_address, network.layerzero_chain_id, claim['amount_in_wei']),
+                        'latest'
+                    ])
+                    for claim in claims
+                ]
+            )
+
+            for claim, l0_gas in zip(claims, l0_gas_quotes):
+                if not isinstance(l0_gas, Exception):
+                    l0_gas = layerzero.decode_l0_gas(HexBytes(l0_gas))
+                    claim['extra_bytes'] = layerzero.get_extra_bytes(l0_gas)
+                    claim['value'] += l0_gas
+                else:
+                    claim['error'] = l0_gas
+
+            send_fees = await rpc_batch(
+                session,
+                network.rpc_url,
+                [
+                    ('eth_call', [
+                        layerzero.get_send_fee_call(
+                            claim_contract_address,
+                            claim['account'].address,
+                            claim['amount_in_wei'],
+                            claim['extra_bytes']
+                        ),
+                        'latest'
+                    ])
+                    for claim in claims
+                ]
+            )
+
+            for claim, send_fee in zip(claims, send_fees):
+                if isinstance(send_fee, Exception):
+                    claim.setdefault('error', send_fee)
+                elif 'error' not in claim:
+                    claim['value'] += layerzero.decode_send_fee(HexBytes(send_fee))
+
+            for claim in [claim for claim in claims if 'error' in claim]:
+                results[claim['account'].address].update(status='error', reason=str(claim['error']))
+
+            claims = [claim for claim in claims if 'error' not in claim]
+
+        for claim in claims:
+            claim['txn'] = {
+                'from': claim['account'].address,
+                'to': claim_contract.address,
+                'value': hex(claim['value']),
+                'data': claim_contract.encodeABI(
+                    'donateAndClaim',
+                    [
+                        2,
+                        claim['donation'],
+                        claim['amount_in_wei'],
+                        claim['proof'],
+                        claim['account'].address,
+                        HexBytes(claim['extra_bytes'])
+                    ]
+                )
+            }
+
+        simulations = await rpc_batch(
+            session,
+            network.rpc_url,
+            [('eth_call', [claim['txn'], 'latest']) for claim in claims]
+        )
+
+        gas_estimates = await rpc_batch(
+            session,
+            network.rpc_url,
+            [('eth_estimateGas', [claim['txn']]) for claim in claims]
+        )
+
+    async def get_gas_fees():
+        gas_fees = await utils.suggest_gas_fees(chain_id=network.chain_id)
+
+        if not gas_fees:
+            raise retry.StepError('Failed to get gas price', enums.ErrorClass.Network)
+
+        return gas_fees
+
+    try:
+        max_fee_per_gas = (await retry.run_step(
+            get_gas_fees,
+            name='Gas price',
+            max_retries=config.max_retries,
+            logging_prefix='Preflight'
+        ))['maxFeePerGas']
+    except retry.StepFailed as e:
+        max_fee_per_gas = e
+
+    known_gas = [int(gas, 16) for gas in gas_estimates if not isinstance(gas, Exception)]
+    fallback_gas = max(known_gas, default=None)
+
+    for claim, simulation, gas in zip(claims, simulations, gas_estimates):
+        result = results[claim['account'].address]
+        native_balance = result['native_balance']
+
+        if isinstance(simulation, Exception) and retry.classify_error(simulation) != enums.ErrorClass.InsufficientFunds:
+            result.update(status='revert', reason=str(simulation))
+            continue
+
+        # Without a gas price or any estimate the cost would leave out gas entirely
+        if isinstance(max_fee_per_gas, Exception):
+            result.update(status='error', reason=str(max_fee_per_gas))
+            continue
+
+        if isinstance(gas, Exception) and fallback_gas is None:
+            result.update(status='error', reason=str(gas))
+            continue
+
+        gas = fallback_gas if isinstance(gas, Exception) else int(gas, 16)
+        cost = claim['value'] + gas * max_fee_per_gas
+
+        result.update(gas=gas, cost=cost)
+
+        if isinstance(simulation, Exception) or native_balance < cost:
+            result.update(status='top_up', top_up=max(cost - native_balance, 0))
+        else:
+            result['status'] = 'ok'
+
+    return list(results.values())
+
+
+async def run_preflight(
+    accounts: list[accounts_loader.BotAccount],
+    default_network: enums.NetworkNames | None
+) -> dict[str, str]:
+    with open('claimed.json') as file:
+        claimed = json.load(file)
+
+    accounts_by_network = collections.defaultdict(list)
+
+    for account in accounts:
+        accounts_by_network[account.network or default_network].append(account)
+
+    logger.info(f'[Preflight] Simulating claims of {len(accounts)} accounts')
+
+    async def run_safe(
+        network_accounts: list[accounts_loader.BotAccount],
+        network_name: enums.NetworkNames
+    ) -> list[dict]:
+        try:
+            return await run_network_preflight(network_accounts, network_name, claimed)
+        except Exception as e:
+            logger.error(f'[Preflight] Failed to simulate claims in {network_name}: {e}')
+            return [
+                {
+                    'address': account.address,
+                    'network': network_name.name,
+                    'status': 'error',
+                    'reason': str(e)
+                }
+                for account in network_accounts
+            ]
+
+    network_results = await asyncio.gather(
+        *[
+            run_safe(network_accounts, network_name)
+            for network_name, network_accounts in accounts_by_network.items()
+        ]
+    )
+
+    results = [result for network_result in network_results for result in network_result]
+
+    summary = {}
+
+    for network_name, network_result in zip(accounts_by_network, network_results):
+        statuses = collections.Counter(result['status'] for result in network_result)
+        cost = sum(result.get('cost', 0) for result in network_result if result['status'] == 'ok')
+        top_up = sum(result.get('top_up', 0) for result in network_result)
+
+        summary[network_name.name] = {
+            'statuses': dict(statuses),
+            'total_cost': cost,
+            'total_top_up': top_up
+        }
+
+        logger.info(
+            f'[Preflight] {network_name}: '
+            + ', '.join(f'{status}: {count}' for status, count in statuses.items())
+            + f'. Claim cost: {AsyncWeb3.from_wei(cost, "ether")}, top-ups needed: {AsyncWeb3.from_wei(top_up, "ether")} native tokens'
+        )
+
+    with open('preflight_report.json', 'w') as file:
+        json.dump(
+            {
+                'summary': summary,
+                'accounts': results
+            },
+            file,
+            indent=4
+        )
+
+    logger.info('[Preflight] Report saved to preflight_report.json')
+
+    return {result['address']: result['status'] for result in results}
@@ -0,0 +1,169 @@
+import asyncio
+import collections
+import contextlib
+import cProfile
+import datetime as dt
+import json
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+
+from logger import logger
+
+profiles_path = Path(__file__).parent / 'profiles'
+
+# Frames of the event loop waiting for I/O, used to tell idle samples from CPU ones
+IDLE_FUNCTIONS = {'select', 'poll', 'epoll', 'kqueue', '_poll'}
+
+
+class InterceptHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord):
+        logger.opt(depth=6, exception=record.exc_info).log(record.levelname, record.getMessage())
+
+
+class Profiler:
+    def __init__(
+        self,
+        slow_callback_duration: float = 0.1,
+        sample_interval: float = 0.005
+    ):
+        self.slow_callback_duration = slow_callback_duration
+        self.sample_interval = sample_interval
+        self.cpu_profile = cProfile.Profile()
+        self.stacks = collections.Counter()
+        self.task_samples = collections.Counter()
+        self.idle_samples = 0
+        self.total_samples = 0
+        self.stage_times = collections.defaultdict(float)
+        self.stage_counts = collections.Counter()
+        self._loop = None
+        self._thread_id = None
+        self._sampler = None
+        self._stop_event = threading.Event()
+        self._start_time = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop.set_debug(True)
+        self._loop.slow_callback_duration = self.slow_callback_duration
+
+        asyncio_logger = logging.getLogger('asyncio')
+        asyncio_logger.setLevel(logging.WARNING)
+        asyncio_logger.addHandler(InterceptHandler())
+
+        self._thread_id = threading.get_ident()
+        self._start_time = time.perf_counter()
+
+        self._sampler = threading.Thread(
+            target=self._sample,
+            name='profiler-sampler',
+            daemon=True
+        )
+        self._sampler.start()
+
+        self.cpu_profile.enable()
+
+        logger.info(f'[Profiler] Profiling enabled, slow callback threshold: {self.slow_callback_duration * 1000:.0f} ms')
+
+    def stop(self) -> Path:
+        self.cpu_profile.disable()
+        self._stop_event.set()
+        self._sampler.join()
+
+        return self.dump()
+
+    def _sample(self):
+        while not self._stop_event.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._thread_id)
+
+            if frame is None:
+                continue
+
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})')
+                frame = frame.f_back
+
+            stack.reverse()
+
+            self.total_samples += 1
+
+            if frame_name(stack[-1]) in IDLE_FUNCTIONS:
+                self.idle_samples += 1
+                self.stacks[';'.join(['idle', *stack])] += 1
+                continue
+
+            task = asyncio.current_task(self._loop)
+            task_name = task.get_name() if task else 'loop'
+
+            self.task_samples[task_name] += 1
+            self.stacks[';'.join([task_name, *stack])] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] += time.perf_counter() - start_time
+            self.stage_counts[name] += 1
+
+    def dump(self) -> Path:
+        profile_path = profiles_path / dt.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        profile_path.mkdir(parents=True, exist_ok=True)
+
+        pstats_path = profile_path / 'cpu.pstats'
+        self.cpu_profile.dump_stats(pstats_path)
+
+        with open(profile_path / 'stacks.folded', 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+        summary = {
+            'wall_time': time.perf_counter() - self._start_time,
+            'sample_interval': self.sample_interval,
+            'samples': self.total_samples,
+            'idle_ratio': self.idle_samples / self.total_samples if self.total_samples else None,
+            'stages': {
+                name: {
+                    'wall_time': self.stage_times[name],
+                    'count': self.stage_counts[name]
+                }
+                for name in sorted(self.stage_times, key=self.stage_times.get, reverse=True)
+            },
+            'tasks_cpu_time': {
+                name: count * self.sample_interval
+                for name, count in self.task_samples.most_common()
+            }
+        }
+
+        with open(profile_path / 'summary.json', 'w') as file:
+            json.dump(summary, file, indent=4)
+
+        logger.info(f'[Profiler] Profile saved to {profile_path}')
+
+        return profile_path
+
+
+def frame_name(frame: str) -> str:
+    return frame.split(' ', 1)[0]
+
+
+active_profiler: Profiler | None = None
+
+
+def start(slow_callback_duration: float) -> Profiler:
+    global active_profiler
+    active_profiler = Profiler(slow_callback_duration=slow_callback_duration)
+    active_profiler.start()
+    return active_profiler
+
+
+def stage(name: str):
+    if active_profiler is None:
+        return contextlib.nullcontext()
+    return active_profiler.stage(name)
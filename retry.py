@@ -0,0 +1,106 @@
+import asyncio
+import random
+import typing
+
+import aiohttp
+from web3.exceptions import ContractLogicError, TimeExhausted
+
+import enums
+from logger import logger
+
+# Base and maximum delay in seconds for every retryable error class.
+# Classes that are missing here are not retried
+BACKOFF = {
+    enums.ErrorClass.Network: (1, 30),
+    enums.ErrorClass.RateLimit: (5, 120),
+    enums.ErrorClass.Nonce: (2, 15),
+    enums.ErrorClass.Unknown: (2, 60)
+}
+
+
+class StepError(Exception):
+    def __init__(
+        self,
+        message: str,
+        error_class: enums.ErrorClass = enums.ErrorClass.Unknown
+    ):
+        super().__init__(message)
+        self.error_class = error_class
+
+
+class StepFailed(Exception):
+    def __init__(
+        self,
+        step: str,
+        error_class: enums.ErrorClass,
+        exc: Exception
+    ):
+        super().__init__(f'{step} failed ({error_class}): {exc}')
+        self.step = step
+        self.error_class = error_class
+        self.exc = exc
+
+
+def classify_error(exc: Exception) -> enums.ErrorClass:
+    if isinstance(exc, StepError):
+        return exc.error_class
+
+    message = str(exc).lower()
+
+    if isinstance(exc, aiohttp.ClientResponseError):
+        if exc.status == 429:
+            return enums.ErrorClass.RateLimit
+        elif exc.status >= 500:
+            return enums.ErrorClass.Network
+
+    if '429' in message or 'too many requests' in message or 'rate limit' in message:
+        return enums.ErrorClass.RateLimit
+    elif 'insufficient funds' in message:
+        return enums.ErrorClass.InsufficientFunds
+    elif any(
+        pattern in message
+        for pattern in ('nonce too low', 'nonce too high', 'replacement transaction underpriced', 'already known')
+    ):
+        return enums.ErrorClass.Nonce
+    elif isinstance(exc, ContractLogicError) or 'execution reverted' in message:
+        return enums.ErrorClass.Revert
+    elif isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientError, ConnectionError, TimeExhausted)):
+        return enums.ErrorClass.Network
+
+    return enums.ErrorClass.Unknown
+
+
+def get_backoff(
+    error_class: enums.ErrorClass,
+    attempt: int
+) -> float:
+    base_delay, max_delay = BACKOFF[error_class]
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+async def run_step(
+    step: typing.Callable[[], typing.Awaitable],
+    name: str,
+    max_retries: int,
+    logging_prefix: str = 'Retry'
+):
+    attempts = max(max_retries, 1)
+
+    for attempt in range(attempts):
+        try:
+            return await step()
+        except Exception as e:
+            error_class = classify_error(e)
+
+            if error_class not in BACKOFF or attempt == attempts - 1:
+                raise StepFailed(name, error_class, e) from e
+
+            delay = get_backoff(error_class, attempt)
+
+            logger.warning(
+                f'[{logging_prefix}] {name} failed ({error_class}): {e}. '
+                f'Retrying in {delay:.1f} seconds ({attempt + 1}/{attempts - 1})'
+            )
+
+            await asyncio.sleep(delay)
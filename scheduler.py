@@ -0,0 +1,125 @@
+import asyncio
+import collections
+import statistics
+import time
+
+from web3 import AsyncWeb3
+
+import constants
+import enums
+from config import config
+from logger import log_event, logger
+
+
+class SendScheduler:
+    def __init__(
+        self,
+        network: constants.Network,
+        base_fee_ceiling: int
+    ):
+        self.network = network
+        self.base_fee_ceiling = base_fee_ceiling
+        self.web3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(network.rpc_url))
+        self.base_fees = collections.deque(maxlen=config.base_fee_history_blocks)
+        self.block_number = None
+        self.released_in_block = 0
+        self.waiters = 0
+        self.condition = asyncio.Condition()
+        self.poll_task = None
+
+    @property
+    def base_fee(self) -> int | None:
+        return self.base_fees[-1] if self.base_fees else None
+
+    async def poll_blocks(self):
+        while self.waiters > 0:
+            try:
+                block = await self.web3.eth.get_block('latest')
+            except Exception as e:
+                logger.warning(f'[Scheduler] Failed to get latest block in {self.network}: {e}')
+            else:
+                if block['number'] != self.block_number:
+                    async with self.condition:
+                        self.block_number = block['number']
+                        self.base_fees.append(block.get('baseFeePerGas', 0))
+                        self.released_in_block = 0
+                        self.condition.notify_all()
+
+            await asyncio.sleep(config.scheduler_poll_interval)
+
+        # Fees seen before a pause say nothing about the next waiter, it has to wait for a fresh block
+        self.base_fees.clear()
+        self.block_number = None
+        self.released_in_block = 0
+        self.poll_task = None
+
+    def is_cheap(self) -> bool:
+        return self.base_fee is not None and self.base_fee <= self.base_fee_ceiling
+
+    async def acquire(self, logging_prefix: str = 'Scheduler'):
+        start_time = time.perf_counter()
+        deadline = time.monotonic() + config.send_deadline
+        announced = False
+
+        self.waiters += 1
+
+        if self.poll_task is None:
+            self.poll_task = asyncio.create_task(self.poll_blocks())
+
+        try:
+            async with self.condition:
+                while True:
+                    late = time.monotonic() >= deadline
+
+                    if (self.is_cheap() or late) and self.released_in_block < config.sends_per_block:
+                        self.released_in_block += 1
+                        break
+
+                    if not announced and self.base_fee is not None and not self.is_cheap():
+                        logger.info(
+                            f'[{logging_prefix}] Holding transaction until base fee in {self.network} drops to '
+                            f'{self.base_fee_ceiling / 10 ** 9} gwei (now {self.base_fee / 10 ** 9:.4f} gwei, '
+                            f'median of last {len(self.base_fees)} blocks {statistics.median(self.base_fees) / 10 ** 9:.4f} gwei)'
+                        )
+                        announced = True
+
+                    held_tasks.add(asyncio.current_task())
+
+                    # Past the deadline only the per-block limit holds the transaction back
+                    try:
+                        await asyncio.wait_for(
+                            self.condition.wait(),
+                            timeout=config.scheduler_poll_interval if late else deadline - time.monotonic()
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self.waiters -= 1
+            held_tasks.discard(asyncio.current_task())
+
+        if announced:
+            log_event(
+                stage='scheduler_release',
+                chain=self.network.name,
+                duration=time.perf_counter() - start_time,
+                base_fee=self.base_fee,
+                deadline_reached=late
+            )
+
+
+schedulers: dict[int, SendScheduler] = {}
+
+# Account tasks waiting for a cheap block don't take a worker slot, so new accounts still get to their claims
+held_tasks: set[asyncio.Task] = set()
+
+
+def get_scheduler(network: constants.Network) -> SendScheduler | None:
+    if network.chain_id not in schedulers:
+        ceiling = config.base_fee_ceilings.get(enums.NetworkNames(network.chain_id).name)
+
+        if ceiling is None:
+            return
+
+        schedulers[network.chain_id] = SendScheduler(network, AsyncWeb3.to_wei(ceiling, 'gwei'))
+
+    return schedulers[network.chain_id]
@@ -0,0 +1,168 @@
+import contextlib
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+def get_shard(address: str, shard_count: int) -> int:
+    return int(hashlib.sha256(address.lower().encode()).hexdigest(), 16) % shard_count
+
+
+def get_owner() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Shared state of a sharded run. Every worker process opens the same SQLite file,
+# workers on other hosts need it on shared storage with working file locks.
+# Workers call it through asyncio.to_thread, so the lock keeps one operation at a time on the connection
+class StateStore:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        # WAL needs every process on one host, the rollback journal also works on network file systems
+        self.connection.execute('PRAGMA journal_mode=DELETE')
+        self.connection.executescript(
+            '''
+            CREATE TABLE IF NOT EXISTS leases (
+                address TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                status TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS comission_plan (
+                address TEXT PRIMARY KEY,
+                amount TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS comission_paid (
+                address TEXT PRIMARY KEY,
+                amount TEXT NOT NULL,
+                shard INTEGER
+            );
+            '''
+        )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        # Serializes read-modify-write of local state files across processes
+        with self.lock:
+            self.connection.execute('BEGIN EXCLUSIVE')
+            try:
+                yield
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            else:
+                self.connection.execute('COMMIT')
+
+    def init_comission_plan(self, plan: dict[str, int]):
+        # The first worker to start wins, so every shard pays from the same plan
+        with self.exclusive():
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO comission_plan (address, amount) VALUES (?, ?)',
+                [(address, str(amount)) for address, amount in plan.items()]
+            )
+
+    def get_comission_plan(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                address: int(amount)
+                for address, amount in self.connection.execute('SELECT address, amount FROM comission_plan')
+            }
+
+    def acquire(
+        self,
+        address: str,
+        owner: str,
+        shard: int,
+        ttl: float
+    ) -> bool:
+        now = time.time()
+
+        with self.exclusive():
+            row = self.connection.execute(
+                'SELECT owner, expires_at, status FROM leases WHERE address = ?',
+                (address,)
+            ).fetchone()
+
+            if row is not None:
+                lease_owner, expires_at, status = row
+
+                if status == 'done' or (status == 'leased' and lease_owner != owner and expires_at > now):
+                    return False
+
+            self.connection.execute(
+                'INSERT OR REPLACE INTO leases (address, owner, shard, expires_at, status) VALUES (?, ?, ?, ?, ?)',
+                (address, owner, shard, now + ttl, 'leased')
+            )
+
+        return True
+
+    def renew(
+        self,
+        address: str,
+        owner: str,
+        ttl: float
+    ):
+        with self.lock:
+            self.connection.execute(
+                'UPDATE leases SET expires_at = ? WHERE address = ? AND owner = ? AND status = ?',
+                (time.time() + ttl, address, owner, 'leased')
+            )
+
+    def finish(
+        self,
+        address: str,
+        owner: str,
+        success: bool
+    ):
+        with self.lock:
+            # Finished rows keep the finish time in expires_at, so a sweep can tell failures of this run from older ones
+            self.connection.execute(
+                'UPDATE leases SET status = ?, expires_at = ? WHERE address = ? AND owner = ?',
+                ('done' if success else 'failed', time.time(), address, owner)
+            )
+
+    def get_leases(self) -> dict[str, tuple[str, float]]:
+        with self.lock:
+            return {
+                address: (status, expires_at)
+                for address, status, expires_at in self.connection.execute('SELECT address, status, expires_at FROM leases')
+            }
+
+    def get_done(self) -> set[str]:
+        with self.lock:
+            return {
+                address
+                for address, in self.connection.execute(
+                    'SELECT address FROM leases WHERE status = ?',
+                    ('done',)
+                )
+            }
+
+    def record_comission(
+        self,
+        address: str,
+        amount: int,
+        shard: int | None
+    ):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO comission_paid (address, amount, shard) VALUES (?, ?, ?)',
+                (address, str(amount), shard)
+            )
+
+    def get_comission_totals(self) -> tuple[int, int]:
+        with self.lock:
+            planned = sum(int(amount) for amount, in self.connection.execute('SELECT amount FROM comission_plan'))
+            paid = sum(int(amount) for amount, in self.connection.execute('SELECT amount FROM comission_paid'))
+            return planned, paid
@@ -1,45 +1,59 @@
 import asyncio
-import datetime as dt
 import random
+import time
+import typing
 
 import aiohttp
-from eth_typing import Hash32, HexStr
+from eth_account.signers.local import LocalAccount
 from hexbytes import HexBytes
 from web3 import AsyncWeb3, Web3
-from web3.eth import AsyncEth
+from web3.contract.async_contract import AsyncContractFunction
+from web3.exceptions import TransactionNotFound
 from web3.types import TxReceipt
 
+import constants
 import enums
+import pending
+import retry
+import scheduler
 from config import config
-from logger import logger
+from logger import log_event, logger
 
 
-async def wait_for_transaction_receipt(
-    web3: AsyncEth,
-    txn_hash: Hash32 | HexBytes | HexStr,
-    timeout: int = 300,
-    logging_prefix: str = 'Receipt'
-) -> TxReceipt:
-    start_time = dt.datetime.now()
-    while True:
-        try:
-            receipt = await web3.wait_for_transaction_receipt(
-                transaction_hash=txn_hash,
-                timeout=timeout - (dt.datetime.now() - start_time).total_seconds()
-            )
-        except Exception as e:
-            logger.warning(f'[{logging_prefix}] Exception occured while waiting for transaction receipt: {e}')
-            if dt.datetime.now() - start_time >= dt.timedelta(seconds=timeout):
-                return
-            await asyncio.sleep(min(5, timeout / 10))
-        else:
-            return receipt
+class RateLimiter:
+    def __init__(self, requests_per_second: float = None):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_time = 0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+
+        now = time.monotonic()
+        wait_time = self.next_time - now
+        self.next_time = max(now, self.next_time) + self.interval
+
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+
+# Suggested fees are shared by all accounts of a chain for GAS_FEES_TTL seconds
+GAS_FEES_TTL = 5
+
+gas_fees_cache: dict[tuple[int, str], tuple[float, dict]] = {}
 
 
 async def suggest_gas_fees(
     chain_id: int,
-    proxy: str = None
+    proxy: str = None,
+    tier: typing.Literal['low', 'medium', 'high'] = 'high'
 ):
+    if (chain_id, tier) in gas_fees_cache:
+        cache_time, gas_fees = gas_fees_cache[chain_id, tier]
+
+        if time.monotonic() - cache_time < GAS_FEES_TTL:
+            return gas_fees
+
     try:
         async with aiohttp.ClientSession() as session:
             response = await session.get(
@@ -57,13 +71,17 @@ async def suggest_gas_fees(
             return
         else:
             gas_json = await response.json()
-            high_gas = gas_json['high']
+            tier_gas = gas_json[tier]
 
-            return {
-                'maxFeePerGas': Web3.to_wei(float(high_gas['suggestedMaxFeePerGas']), 'gwei'),
-                'maxPriorityFeePerGas': Web3.to_wei(float(high_gas['suggestedMaxPriorityFeePerGas']), 'gwei')
+            gas_fees = {
+                'maxFeePerGas': Web3.to_wei(float(tier_gas['suggestedMaxFeePerGas']), 'gwei'),
+                'maxPriorityFeePerGas': Web3.to_wei(float(tier_gas['suggestedMaxPriorityFeePerGas']), 'gwei')
             }
 
+            gas_fees_cache[chain_id, tier] = time.monotonic(), gas_fees
+
+            return gas_fees
+
 
 async def random_sleep():
     sleep_time = round(random.uniform(config.min_sleep_time, config.max_sleep_time), 2)
@@ -71,15 +89,143 @@ async def random_sleep():
     await asyncio.sleep(sleep_time)
 
 
+gas_templates: dict[tuple[int, str, str, bool], int] = {}
+
+
+async def get_gas_template_key(
+    web3: AsyncWeb3,
+    txn: dict
+) -> tuple[int, str, str, bool] | None:
+    data = txn.get('data') or ''
+
+    if isinstance(data, bytes):
+        data = '0x' + data.hex()
+
+    selector = data[:10].lower()
+
+    # Arbitrum estimates include the L1 calldata cost, which follows L1 fees
+    if selector not in constants.GAS_TEMPLATE_SELECTORS or txn.get('chainId', None) == enums.NetworkNames.Arbitrum.value:
+        return
+
+    # Sending to an empty balance slot costs about 17k gas more than to a funded one
+    recipient_balance = await web3.eth.call(
+        {
+            'to': txn['to'],
+            'data': constants.BALANCE_OF_SELECTOR + data[10:74]
+        }
+    )
+
+    return txn['chainId'], str(txn['to']).lower(), selector, int.from_bytes(recipient_balance, 'big') == 0
+
+
 async def estimate_gas(
     web3: AsyncWeb3,
     txn: dict
-) -> int:
+) -> tuple[int, tuple[int, str, str, bool] | None]:
+    key = await get_gas_template_key(web3, txn)
+
+    if key in gas_templates:
+        return gas_templates[key], key
+
     multiplier = 1.1 if txn.get('chainId', None) in {
         enums.NetworkNames.Base.value,
         enums.NetworkNames.Optimism.value
     } else 1
 
-    gas = await web3.eth.estimate_gas(txn)
+    gas = int(await web3.eth.estimate_gas(txn) * multiplier)
+
+    if key is not None:
+        gas_templates[key] = max(int(gas * constants.GAS_TEMPLATE_MULTIPLIER), gas_templates.get(key, 0))
+
+    # Only a reused template is reported, a fresh estimate is exact for this transaction
+    return gas, None
+
+
+async def send_transaction(
+    web3: AsyncWeb3,
+    network: constants.Network,
+    eth_account: LocalAccount,
+    function: AsyncContractFunction,
+    value: int = 0,
+    proxy: str = None,
+    logging_prefix: str = 'Transaction',
+    stage: str = 'transaction',
+    sent_hashes: list[HexBytes] = None,
+    urgent: bool = True,
+    **event_fields
+) -> TxReceipt:
+    if sent_hashes is None:
+        sent_hashes = []
+
+    # A previous attempt of the same step may have landed after its receipt timed out
+    for sent_hash in sent_hashes:
+        try:
+            receipt = await web3.eth.get_transaction_receipt(sent_hash)
+        except TransactionNotFound:
+            continue
+
+        if receipt['status'] == 1:
+            return receipt
+
+    send_scheduler = scheduler.get_scheduler(network)
+
+    # Non-urgent transactions wait for a cheap block and don't need the top fee tier
+    if send_scheduler and not urgent:
+        await send_scheduler.acquire(logging_prefix)
+
+    gas_price = await suggest_gas_fees(
+        chain_id=network.chain_id,
+        proxy=proxy,
+        tier='high' if urgent or not send_scheduler else 'medium'
+    )
+
+    if not gas_price:
+        raise retry.StepError('Failed to get gas price', enums.ErrorClass.Network)
+
+    # Explicit gas prevents build_transaction from calling eth_estimateGas on its own
+    txn = await function.build_transaction(
+        {
+            'chainId': network.chain_id,
+            'nonce': await web3.eth.get_transaction_count(eth_account.address),
+            'from': eth_account.address,
+            'value': value,
+            'gas': 0,
+            **gas_price
+        }
+    )
+
+    txn['gas'], gas_template_key = await estimate_gas(web3, txn)
+
+    start_time = time.perf_counter()
+
+    txn_hash, receipt = await pending.manager.send(
+        web3=web3,
+        network=network,
+        eth_account=eth_account,
+        txn=txn,
+        proxy=proxy,
+        logging_prefix=logging_prefix,
+        sent_hashes=sent_hashes
+    )
+
+    log_event(
+        stage=stage,
+        account=eth_account.address,
+        chain=network.name,
+        txn_hash=txn_hash.hex(),
+        duration=time.perf_counter() - start_time,
+        status=receipt['status'] if receipt else None,
+        **event_fields
+    )
+
+    if not receipt:
+        raise retry.StepError('Transaction was not mined in time', enums.ErrorClass.Network)
+    elif receipt['status'] != 1:
+        # A reused gas template may have been too low, so the step gets one retry with a fresh estimate
+        if gas_template_key is not None:
+            gas_templates.pop(gas_template_key, None)
+            raise retry.StepError('Transaction with templated gas reverted', enums.ErrorClass.Unknown)
+
+        raise retry.StepError('Transaction reverted', enums.ErrorClass.Revert)
 
-    return int(gas * multiplier)
+    return receipt